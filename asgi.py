@@ -0,0 +1,97 @@
+"""ASGI entry point: the copier API on FastAPI/uvicorn (see Procfile)
+
+This is the production server. The Flask app in simple_copier_server is kept
+for local runs (python simple_copier_server.py); storage and request handling
+live there and are shared by both apps. The handlers never await while holding a master lock,
+so on the event loop those locks are never contended.
+"""
+
+from typing import Any, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict
+
+import simple_copier_server as copier
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+
+class SignalIn(BaseModel):
+    """Master EA signal - extra trade fields (volume, price, sl, tp...) pass through"""
+
+    model_config = ConfigDict(extra="allow")
+
+    # Untyped pass-through, so the shared handler validates (and dedups on)
+    # exactly the values the Flask app would see - no coercion, no extra 400s
+    master_id: Any = None
+    action: Any = None
+    master_ticket: Any = None
+    symbol: Any = None
+
+
+class SlaveIn(BaseModel):
+    slave_id: Any = None
+    master_id: Any = None
+
+
+def _respond(name, handler, *args):
+    try:
+        body, code = handler(*args)
+    except Exception as e:
+        copier.log.exception("ERROR in %s: %s", name, e)
+        body, code = {"error": str(e)}, 500
+
+    if isinstance(body, bytes):
+        # Already serialized (slave_poll hot path)
+        return Response(body, status_code=code, media_type="application/json")
+    return ORJSONResponse(body, status_code=code)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_error(request: Request, exc: RequestValidationError):
+    errors = "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+        for err in exc.errors()
+    )
+    return ORJSONResponse({"error": errors}, status_code=400)
+
+
+# ==================== ROUTES ====================
+@app.get("/")
+async def home():
+    return _respond("home", copier.handle_home)
+
+
+@app.post("/upload_signal")
+async def upload_signal(signal: Optional[SignalIn] = None):
+    """Master EA sends trade signal"""
+    data = signal.model_dump(exclude_unset=True) if signal else None
+    return _respond("upload_signal", copier.handle_upload_signal, data)
+
+
+@app.post("/register_slave")
+async def register_slave(slave: Optional[SlaveIn] = None):
+    """Slave EA registers to copy from master"""
+    data = slave.model_dump(exclude_unset=True) if slave else None
+    return _respond("register_slave", copier.handle_register_slave, data)
+
+
+@app.get("/slave_poll")
+async def slave_poll(slave_id: Optional[str] = None, master_id: Optional[str] = None):
+    """Slave EA polls for new signals"""
+    return _respond("slave_poll", copier.handle_slave_poll, slave_id, master_id)
+
+
+@app.post("/clear_signals")
+async def clear_signals(targets: SlaveIn):
+    """Clear signals and processed tracking"""
+    data = targets.model_dump(exclude_unset=True)
+    return _respond("clear_signals", copier.handle_clear_signals, data)
+
+
+@app.get("/status")
+async def status(verbose: Optional[str] = None):
+    """Get detailed server status (?verbose=1 adds each master's signal list)"""
+    return _respond("status", copier.handle_status, verbose == "1")
@@ -1,331 +1,666 @@
-from flask import Flask, request, jsonify
-from datetime import datetime, timedelta
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+import itertools
 import time
-import json
 import threading
+import logging
 import os
 
+import orjson
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL", "WARNING").upper())
+log = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson instead of the stdlib encoder"""
+
+    def _options(self, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options(pretty)),
+            mimetype=self.mimetype,
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+# Never sort keys or pretty-print (replaces JSON_SORT_KEYS / JSONIFY_PRETTYPRINT_REGULAR)
+app.json.sort_keys = False
+app.json.compact = True
 
 print("=" * 60)
 print("MT5 TRADE COPIER SERVER - FINAL FIX v6.0")
 print("=" * 60)
 
+# Signal actions
+VALID_ACTIONS = frozenset(
+    {
+        "NEW_TRADE",
+        "NEW_PENDING",
+        "MODIFY_TRADE",
+        "MODIFY_PENDING",
+        "CLOSE_TRADE",
+        "DELETE_ORDER",
+        "INIT_TEST",
+        "HEARTBEAT",
+    }
+)
+SKIP_QUEUE = frozenset({"INIT_TEST", "HEARTBEAT"})  # acknowledged, never queued
+SYMBOL_REQUIRED = VALID_ACTIONS - {"DELETE_ORDER"} - SKIP_QUEUE
+NEW_ACTIONS = frozenset({"NEW_TRADE", "NEW_PENDING"})
+MODIFY_ACTIONS = frozenset({"MODIFY_TRADE", "MODIFY_PENDING"})
+CLOSE_ACTIONS = frozenset({"CLOSE_TRADE", "DELETE_ORDER"})
+SCALAR_TYPES = (str, int, float)  # accepted master_ticket / symbol JSON types
+
+
+class ProcessedSignals:
+    """Last processed signal IDs for a slave, oldest first
+
+    A bloom filter (a bitmask in a plain int) sits in front of the deque so
+    unseen IDs are rejected without scanning it. Bits of evicted IDs are
+    only dropped when the filter is rebuilt, once per maxlen evictions.
+    """
+
+    BLOOM_BITS = 4096
+    BLOOM_HASHES = 3
+
+    def __init__(self, maxlen=200):
+        self._ids = deque(maxlen=maxlen)
+        self._bloom = 0
+        self._evictions = 0
+
+    @classmethod
+    def _mask(cls, signal_id):
+        # Integer IDs hash to themselves - scramble them before slicing bits
+        h = (hash(signal_id) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        mask = 0
+        for i in range(cls.BLOOM_HASHES):
+            mask |= 1 << ((h >> (i * 12)) % cls.BLOOM_BITS)
+        return mask
+
+    def __contains__(self, signal_id):
+        mask = self._mask(signal_id)
+        if self._bloom & mask != mask:
+            return False
+        return signal_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def recent(self, n):
+        """Last n processed IDs, oldest first, without copying the whole deque"""
+        return list(itertools.islice(reversed(self._ids), n))[::-1]
+
+    def add(self, signal_id):
+        if len(self._ids) == self._ids.maxlen:
+            self._evictions += 1
+        self._ids.append(signal_id)
+        self._bloom |= self._mask(signal_id)
+
+        if self._evictions >= self._ids.maxlen:
+            self._bloom = 0
+            for sid in self._ids:
+                self._bloom |= self._mask(sid)
+            self._evictions = 0
+
+    def clear(self):
+        self._ids.clear()
+        self._bloom = 0
+        self._evictions = 0
+
+
 # Storage structures
-signals_queue = {}  # master_id -> list of signals with unique IDs
-slaves = {}  # master_id -> dict of slave_id -> slave_info
-slave_processed_signals = {}  # slave_id -> set of processed signal IDs
+MAX_QUEUE_SIZE = 50  # max live signals kept per master (removed slots don't count)
+SIGNAL_TTL_MS = 10 * 60 * 1000  # signals are dropped after 10 minutes
+signals_queue = {}  # master_id -> deque of signals (None marks a removed signal)
+signals_offset = {}  # master_id -> position of the first signal in the deque
+signals_by_key = {}  # master_id -> (ticket, action, symbol) -> NEW_* position
+signals_by_ticket = {}  # master_id -> ticket -> positions of queued signals
+signals_by_action = {}  # master_id -> Counter of queued signals per action
+signals_json = {}  # signal_id -> orjson bytes of the queued signal, sent as-is
+# Slave registries create their per-master/per-slave entry on first lookup;
+# signals_queue stays a plain dict since a queue's presence marks an active master
+slaves = defaultdict(dict)  # master_id -> slave_id -> slave_info (epoch ms times)
+slave_processed_signals = defaultdict(ProcessedSignals)  # slave_id -> ProcessedSignals
+slave_cursors = defaultdict(dict)  # slave_id -> master_id -> next position to send
+
+# Integer signal IDs, seeded with the startup time in microseconds so IDs keep
+# increasing across restarts. They are compared as ints internally and sent to
+# the EAs as strings (see _wire_signal)
+signal_ids = itertools.count(time.time_ns() // 1000)
+
+# One lock per master guards its queue, indexes and slave registry, so
+# different masters never wait on each other
+master_locks = defaultdict(threading.Lock)
+
+
+def _init_master_queue(master_id):
+    """Create the signal queue and its indexes for a master"""
+    signals_queue[master_id] = deque()
+    # Positions keep counting up across drops so slave cursors stay valid
+    signals_offset.setdefault(master_id, 0)
+    signals_by_key[master_id] = {}
+    signals_by_ticket[master_id] = defaultdict(list)
+    signals_by_action[master_id] = Counter()
+
+
+def _drop_master_queue(master_id):
+    """Remove the signal queue and its indexes for a master"""
+    signals_offset[master_id] += len(signals_queue[master_id])
+    for signal in signals_queue[master_id]:
+        if signal is not None:
+            del signals_json[signal["signal_id"]]
+    del signals_queue[master_id]
+    del signals_by_key[master_id]
+    del signals_by_ticket[master_id]
+    del signals_by_action[master_id]
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def _now():
+    """Current time as (epoch ms, ISO string) from a single clock read"""
+    ns = time.time_ns()
+    return ns // 1_000_000, datetime.fromtimestamp(ns / 1e9).isoformat()
+
+
+def _wire_signal(signal):
+    """Signal as sent to the EAs, which read signal_id as a string"""
+    return {**signal, "signal_id": str(signal["signal_id"])}
+
+
+def _signal_key(signal):
+    return (signal["master_ticket"], signal["action"], signal.get("symbol"))
+
+
+def _pending_count(master_id):
+    """Number of queued signals for a master (lock held)"""
+    return sum(signals_by_action[master_id].values())
+
+
+def _uncount_signal(master_id, signal):
+    counts = signals_by_action[master_id]
+    counts[signal["action"]] -= 1
+    if not counts[signal["action"]]:
+        del counts[signal["action"]]
+
+
+def _pop_oldest_signal(master_id):
+    """Drop the head of the master queue, returns the signal (None if removed)"""
+    signal = signals_queue[master_id].popleft()
+    signals_offset[master_id] += 1
+
+    if signal is not None:
+        # The head is always the oldest position queued for its ticket
+        by_ticket = signals_by_ticket[master_id]
+        ticket = signal["master_ticket"]
+        by_ticket[ticket].pop(0)
+        if not by_ticket[ticket]:
+            del by_ticket[ticket]
+        signals_by_key[master_id].pop(_signal_key(signal), None)
+        _uncount_signal(master_id, signal)
+        del signals_json[signal["signal_id"]]
+
+    return signal
+
+
+def _append_signal(master_id, signal):
+    """Append a signal to the master queue, keeping the indexes in sync"""
+    queue = signals_queue[master_id]
+
+    # Serialize once here - every slave poll reuses these bytes. Done before
+    # any state changes, so a value orjson can't encode fails the upload
+    # cleanly; the index steps below can't fail on the validated keys, and
+    # the queue append comes last, so signals_json always has queued signals
+    signal_json = orjson.dumps(_wire_signal(signal))
+
+    # Keep queue size manageable (max 50 live signals per master) - removed
+    # slots at the head go freely, a live signal only once the cap is reached
+    while queue and (queue[0] is None or _pending_count(master_id) >= MAX_QUEUE_SIZE):
+        if _pop_oldest_signal(master_id) is not None:
+            log.warning("Queue limit reached for %s - removed oldest signal", master_id)
 
+    # Indexes first, the queue last, so a signal is never queued unindexed
+    position = signals_offset[master_id] + len(queue)
+    signals_by_ticket[master_id][signal["master_ticket"]].append(position)
+    if signal["action"] in NEW_ACTIONS:
+        signals_by_key[master_id][_signal_key(signal)] = position
+    signals_by_action[master_id][signal["action"]] += 1
+    signals_json[signal["signal_id"]] = signal_json
+    queue.append(signal)
 
-def cleanup_old_signals():
-    """Clean up signals older than 10 minutes"""
-    while True:
-        time.sleep(60)
-        now = datetime.now()
 
-        for master_id in list(signals_queue.keys()):
-            if master_id in signals_queue:
-                # Keep only signals from last 10 minutes
-                original_count = len(signals_queue[master_id])
-                signals_queue[master_id] = [
-                    s
-                    for s in signals_queue[master_id]
-                    if (
-                        now
-                        - datetime.fromisoformat(
-                            s.get("server_timestamp", "2000-01-01")
-                        )
-                    ).seconds
-                    < 600
-                ]
+def _remove_ticket_signals(master_id, master_ticket):
+    """Mark every queued signal for a ticket as removed, returns how many"""
+    queue = signals_queue[master_id]
+    offset = signals_offset[master_id]
+    positions = signals_by_ticket[master_id].pop(master_ticket, [])
 
-                cleaned_count = original_count - len(signals_queue[master_id])
-                if cleaned_count > 0:
-                    print(f"🗑️ Cleaned {cleaned_count} old signals for {master_id}")
+    for position in positions:
+        signal = queue[position - offset]
+        signals_by_key[master_id].pop(_signal_key(signal), None)
+        _uncount_signal(master_id, signal)
+        del signals_json[signal["signal_id"]]
+        queue[position - offset] = None
 
-                if not signals_queue[master_id]:
-                    del signals_queue[master_id]
+    return len(positions)
 
 
-cleanup_thread = threading.Thread(target=cleanup_old_signals, daemon=True)
-cleanup_thread.start()
+def _expire_signals(master_id, now_ms):
+    """Drop signals older than 10 minutes from a master queue (lock held)
 
+    Signals are queued in arrival order, so expired ones are always at the
+    head. An emptied queue is dropped altogether.
+    """
+    queue = signals_queue.get(master_id)
+    if queue is None:
+        return
 
-# ==================== ROUTES ====================
-@app.route("/", methods=["GET"])
-def home():
-    return jsonify(
-        {
-            "status": "MT5 Trade Copier Server - Final Fix v6.0",
-            "version": "6.0",
-            "fixes": [
-                "Optional symbol field for DELETE_ORDER",
-                "Modify signals always create new entries",
-                "Unique signal IDs with timestamps",
-                "Better duplicate prevention",
-                "10-minute signal retention",
-                "FIXED: Returns oldest unprocessed signal first",
-                "FIXED: Only marks returned signal as processed",
-            ],
-            "stats": {
-                "active_masters": len(signals_queue),
-                "total_signals": sum(len(sigs) for sigs in signals_queue.values()),
-                "registered_slaves": sum(len(s) for s in slaves.values()),
-            },
-        }
-    )
+    cutoff = now_ms - SIGNAL_TTL_MS
+    cleaned_count = 0
+    while queue and (queue[0] is None or queue[0]["server_ts_ms"] <= cutoff):
+        if _pop_oldest_signal(master_id) is not None:
+            cleaned_count += 1
 
+    if cleaned_count > 0:
+        log.info("Cleaned %d old signals for %s", cleaned_count, master_id)
 
-@app.route("/upload_signal", methods=["POST"])
-def upload_signal():
+    if not queue:
+        _drop_master_queue(master_id)
+
+
+# ==================== HANDLERS ====================
+# Framework-neutral request handlers shared by the Flask app below and the
+# FastAPI app in asgi.py. Each returns (response dict, HTTP status); the
+# slave_poll success body is pre-serialized JSON bytes instead of a dict.
+
+
+def handle_home():
+    # Counting first also expires stale masters before they are counted
+    now_ms = _now_ms()
+    total_signals = 0
+    for master_id in list(signals_queue):
+        with master_locks[master_id]:
+            _expire_signals(master_id, now_ms)
+            if master_id in signals_queue:
+                total_signals += _pending_count(master_id)
+
+    return {
+        "status": "MT5 Trade Copier Server - Final Fix v6.0",
+        "version": "6.0",
+        "fixes": [
+            "Optional symbol field for DELETE_ORDER",
+            "Modify signals always create new entries",
+            "Unique signal IDs with timestamps",
+            "Better duplicate prevention",
+            "10-minute signal retention",
+            "FIXED: Returns oldest unprocessed signal first",
+            "FIXED: Only marks returned signal as processed",
+        ],
+        "stats": {
+            "active_masters": len(signals_queue),
+            "total_signals": total_signals,
+            "registered_slaves": sum(len(s) for s in list(slaves.values())),
+        },
+    }, 200
+
+
+def handle_upload_signal(data):
     """Master EA sends trade signal"""
-    try:
-        data = request.get_json()
+    if not data:
+        return {"error": "No data provided"}, 400
 
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "RECEIVED SIGNAL: %s",
+            orjson.dumps(data, option=orjson.OPT_INDENT_2).decode(),
+        )
 
-        print(f"\n📥 RECEIVED SIGNAL: {json.dumps(data, indent=2)}")
+    # Required fields (symbol is optional for DELETE_ORDER)
+    master_id = data.get("master_id")
+    action = data.get("action")
+    master_ticket = data.get("master_ticket")
 
-        # Required fields (symbol is optional for DELETE_ORDER)
-        master_id = data.get("master_id")
-        action = data.get("action")
-        master_ticket = data.get("master_ticket")
+    if not master_id or not action or master_ticket is None:
+        return {"error": "Missing master_id, action, or master_ticket"}, 400
 
-        if not master_id or not action or master_ticket is None:
-            return (
-                jsonify({"error": "Missing master_id, action, or master_ticket"}),
-                400,
-            )
+    # Validate action
+    if action not in VALID_ACTIONS:
+        return {"error": f"Invalid action: {action}"}, 400
+
+    # Symbol is required for all actions except DELETE_ORDER, INIT_TEST, HEARTBEAT
+    if action in SYMBOL_REQUIRED:
+        if "symbol" not in data:
+            return {"error": f"Missing symbol for action {action}"}, 400
+
+    # Skip test and heartbeat signals from queue
+    if action in SKIP_QUEUE:
+        log.info("%s from %s", action, master_id)
+        return {"status": "acknowledged", "action": action}, 200
 
-        # Validate action
-        valid_actions = [
-            "NEW_TRADE",
-            "NEW_PENDING",
-            "MODIFY_TRADE",
-            "MODIFY_PENDING",
-            "CLOSE_TRADE",
-            "DELETE_ORDER",
-            "INIT_TEST",
-            "HEARTBEAT",
-        ]
-
-        if action not in valid_actions:
-            return jsonify({"error": f"Invalid action: {action}"}), 400
-
-        # Symbol is required for all actions except DELETE_ORDER, INIT_TEST, HEARTBEAT
-        if action not in ["DELETE_ORDER", "INIT_TEST", "HEARTBEAT"]:
-            if "symbol" not in data:
-                return jsonify({"error": f"Missing symbol for action {action}"}), 400
-
-        # Skip test and heartbeat signals from queue
-        if action in ["INIT_TEST", "HEARTBEAT"]:
-            print(f"ℹ️ {action} from {master_id}")
-            return jsonify({"status": "acknowledged", "action": action})
-
-        # Add server timestamp
-        server_time = datetime.now().isoformat()
-        data["server_timestamp"] = server_time
-
-        # Create unique signal ID (ticket + action + timestamp)
-        signal_id = f"{master_ticket}_{action}_{int(datetime.now().timestamp() * 1000)}"
-        data["signal_id"] = signal_id
+    # Ticket and symbol key the queue indexes, so they must be plain scalars
+    if not isinstance(master_ticket, SCALAR_TYPES):
+        return {"error": "Invalid master_ticket: must be a string or number"}, 400
+    if not isinstance(data.get("symbol"), SCALAR_TYPES + (type(None),)):
+        return {"error": "Invalid symbol: must be a string or number"}, 400
+
+    # Add server timestamp (epoch ms for expiry, ISO string for the EAs)
+    server_ts_ms, data["server_timestamp"] = _now()
+    data["server_ts_ms"] = server_ts_ms
+
+    # Create unique signal ID
+    signal_id = next(signal_ids)
+    data["signal_id"] = signal_id
+
+    with master_locks[master_id]:
+        _expire_signals(master_id, server_ts_ms)
 
         # Initialize if needed
         if master_id not in signals_queue:
-            signals_queue[master_id] = []
+            _init_master_queue(master_id)
 
         # For MODIFY actions, ALWAYS add new signal (don't update existing)
-        if action in ["MODIFY_TRADE", "MODIFY_PENDING"]:
-            signals_queue[master_id].append(data)
-            print(
-                f"✅ Added NEW modification signal: {action} for ticket {master_ticket}"
+        if action in MODIFY_ACTIONS:
+            _append_signal(master_id, data)
+            log.info(
+                "Added NEW modification signal: %s for ticket %s (%s)",
+                action,
+                master_ticket,
+                signal_id,
             )
-            print(f"   Signal ID: {signal_id}")
 
         # For DELETE_ORDER and CLOSE_TRADE, remove any pending NEW/MODIFY signals for same ticket
-        elif action in ["DELETE_ORDER", "CLOSE_TRADE"]:
+        elif action in CLOSE_ACTIONS:
             # Remove any unprocessed signals for this ticket
-            removed_count = len(signals_queue[master_id])
-            signals_queue[master_id] = [
-                s
-                for s in signals_queue[master_id]
-                if s.get("master_ticket") != master_ticket
-            ]
-            removed_count = removed_count - len(signals_queue[master_id])
+            removed_count = _remove_ticket_signals(master_id, master_ticket)
 
             # Add the close/delete signal
-            signals_queue[master_id].append(data)
-            print(f"✅ Added {action} signal for ticket {master_ticket}")
-            if removed_count > 0:
-                print(f"   Removed {removed_count} pending signals for this ticket")
+            _append_signal(master_id, data)
+            log.info(
+                "Added %s signal for ticket %s (removed %d pending signals)",
+                action,
+                master_ticket,
+                removed_count,
+            )
 
         # For NEW_TRADE and NEW_PENDING
         else:
             # Check if identical signal already exists (prevent true duplicates)
-            is_duplicate = False
-            for sig in signals_queue[master_id]:
-                if (
-                    sig.get("master_ticket") == master_ticket
-                    and sig.get("action") == action
-                    and sig.get("symbol") == data.get("symbol")
-                ):
-                    is_duplicate = True
-                    print(
-                        f"⚠️ Duplicate {action} signal for ticket {master_ticket} - skipping"
-                    )
-                    break
-
-            if not is_duplicate:
-                signals_queue[master_id].append(data)
-                print(f"✅ Added {action} signal for ticket {master_ticket}")
-
-        # Keep queue size manageable (max 50 signals per master)
-        if len(signals_queue[master_id]) > 50:
-            removed = len(signals_queue[master_id]) - 50
-            signals_queue[master_id] = signals_queue[master_id][-50:]
-            print(f"⚠️ Queue limit reached - removed {removed} oldest signals")
-
-        print(
-            f"📊 Current queue for {master_id}: {len(signals_queue[master_id])} signals"
-        )
-
-        return jsonify(
-            {
-                "status": "received",
-                "master_id": master_id,
-                "action": action,
-                "ticket": master_ticket,
-                "signal_id": signal_id,
-            }
-        )
-
-    except Exception as e:
-        print(f"❌ ERROR in upload_signal: {e}")
-        import traceback
+            if _signal_key(data) in signals_by_key[master_id]:
+                log.info(
+                    "Duplicate %s signal for ticket %s - skipping",
+                    action,
+                    master_ticket,
+                )
+            else:
+                _append_signal(master_id, data)
+                log.info("Added %s signal for ticket %s", action, master_ticket)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "Current queue for %s: %d signals",
+                master_id,
+                _pending_count(master_id),
+            )
 
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    return {
+        "status": "received",
+        "master_id": master_id,
+        "action": action,
+        "ticket": master_ticket,
+        "signal_id": str(signal_id),
+    }, 200
 
 
-@app.route("/register_slave", methods=["POST"])
-def register_slave():
+def handle_register_slave(data):
     """Slave EA registers to copy from master"""
-    try:
-        data = request.get_json()
+    if not data:
+        return {"error": "No data provided"}, 400
 
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
+    slave_id = data.get("slave_id")
+    master_id = data.get("master_id")
 
-        slave_id = data.get("slave_id")
-        master_id = data.get("master_id")
+    if not slave_id or not master_id:
+        return {"error": "Missing slave_id or master_id"}, 400
 
-        if not slave_id or not master_id:
-            return jsonify({"error": "Missing slave_id or master_id"}), 400
-
-        # Initialize structures
-        if master_id not in slaves:
-            slaves[master_id] = {}
+    now_ms, now_iso = _now()
 
+    with master_locks[master_id]:
         slaves[master_id][slave_id] = {
-            "registered_at": datetime.now().isoformat(),
-            "last_poll": datetime.now().isoformat(),
+            "registered_at": now_ms,
+            "last_poll": now_ms,
         }
 
-        # Initialize processed signals set
-        if slave_id not in slave_processed_signals:
-            slave_processed_signals[slave_id] = set()
-
-        print(f"✅ SLAVE REGISTERED: {slave_id} → {master_id}")
+    # Initialize processed signals tracking
+    slave_processed_signals.setdefault(slave_id, ProcessedSignals())
 
-        return jsonify(
-            {
-                "status": "registered",
-                "slave_id": slave_id,
-                "master_id": master_id,
-                "timestamp": datetime.now().isoformat(),
-            }
-        )
+    log.info("SLAVE REGISTERED: %s -> %s", slave_id, master_id)
 
-    except Exception as e:
-        print(f"❌ ERROR in register_slave: {e}")
-        return jsonify({"error": str(e)}), 500
+    return {
+        "status": "registered",
+        "slave_id": slave_id,
+        "master_id": master_id,
+        "timestamp": now_iso,
+    }, 200
 
 
-@app.route("/slave_poll", methods=["GET"])
-def slave_poll():
+def handle_slave_poll(slave_id, master_id):
     """Slave EA polls for new signals - FIXED VERSION"""
-    try:
-        slave_id = request.args.get("slave_id")
-        master_id = request.args.get("master_id")
-
-        if not slave_id or not master_id:
-            return jsonify({"error": "Missing slave_id or master_id"}), 400
-
-        # Check if slave is registered
-        if master_id not in slaves or slave_id not in slaves[master_id]:
-            # Auto-register
-            if master_id not in slaves:
-                slaves[master_id] = {}
-            slaves[master_id][slave_id] = {
-                "registered_at": datetime.now().isoformat(),
-                "last_poll": datetime.now().isoformat(),
-            }
+    if not slave_id or not master_id:
+        return {"error": "Missing slave_id or master_id"}, 400
 
-        # Update last poll time
-        slaves[master_id][slave_id]["last_poll"] = datetime.now().isoformat()
+    now_ms, now_iso = _now()
+
+    with master_locks[master_id]:
+        # Auto-register unknown slaves, then update last poll time
+        slave_info = slaves[master_id].setdefault(slave_id, {"registered_at": now_ms})
+        slave_info["last_poll"] = now_ms
 
         # Get unprocessed signals
-        signal_to_return = None
+        signal_json = None
+        _expire_signals(master_id, now_ms)
 
         if master_id in signals_queue:
-            if slave_id not in slave_processed_signals:
-                slave_processed_signals[slave_id] = set()
+            queue = signals_queue[master_id]
+            offset = signals_offset[master_id]
+            processed = slave_processed_signals[slave_id]
+            cursors = slave_cursors[slave_id]
+
+            # Everything before the cursor was already sent to this slave
+            start = max(cursors.get(master_id, offset) - offset, 0)
 
             # FIXED: Find OLDEST unprocessed signal (FIFO - First In First Out)
-            for signal in signals_queue[master_id]:
-                signal_id = signal.get("signal_id")
+            for index in range(start, len(queue)):
+                signal = queue[index]
+                cursors[master_id] = offset + index + 1
+                if signal is None:
+                    continue
 
-                if signal_id and signal_id not in slave_processed_signals[slave_id]:
+                # Queued signals always carry these keys - subscript, don't .get()
+                signal_id = signal["signal_id"]
+
+                if signal_id not in processed:
                     # Found the oldest unprocessed signal
-                    signal_to_return = signal
+                    signal_json = signals_json[signal_id]
 
                     # Mark THIS signal as processed
-                    slave_processed_signals[slave_id].add(signal_id)
-
-                    print(
-                        f"📤 Sending to {slave_id}: {signal.get('action')} ticket {signal.get('master_ticket')}"
+                    processed.add(signal_id)
+
+                    log.info(
+                        "Sending to %s: %s ticket %s (%s)",
+                        slave_id,
+                        signal["action"],
+                        signal["master_ticket"],
+                        signal_id,
                     )
-                    print(f"   Signal ID: {signal_id}")
 
                     # Only send ONE signal at a time
                     break
 
-            # Clean up processed signals set (keep last 200)
-            if len(slave_processed_signals[slave_id]) > 200:
-                signal_list = list(slave_processed_signals[slave_id])
-                slave_processed_signals[slave_id] = set(signal_list[-200:])
+    # Return the signal (or empty list if none), splicing in its cached JSON
+    if signal_json is None:
+        signal_json, count = b"", b"0"
+    else:
+        count = b"1"
+    timestamp = orjson.dumps(now_iso)
+
+    return (
+        b'{"status":"ok","signals":[%b],"count":%b,"timestamp":%b}'
+        % (signal_json, count, timestamp),
+        200,
+    )
+
 
-        # Return the signal (or empty list if none)
-        signals_to_return = [signal_to_return] if signal_to_return else []
+def handle_clear_signals(data):
+    """Clear signals and processed tracking"""
+    master_id = data.get("master_id")
+    slave_id = data.get("slave_id")
+
+    cleared = {}
+
+    if slave_id:
+        # Clear processed signals for slave
+        # Swap in fresh tracking instead of mutating it, so a poll running
+        # under a master lock never sees it half cleared
+        if slave_id in slave_processed_signals:
+            count = len(slave_processed_signals[slave_id])
+            slave_processed_signals[slave_id] = ProcessedSignals()
+            log.info("Cleared %d processed signals for slave %s", count, slave_id)
+            cleared["slave_processed"] = count
+        slave_cursors.pop(slave_id, None)
+
+    if master_id:
+        # Clear signal queue for master
+        with master_locks[master_id]:
+            if master_id in signals_queue:
+                count = _pending_count(master_id)
+                _drop_master_queue(master_id)
+                log.info("Cleared %d signals for master %s", count, master_id)
+                cleared["master_queue"] = count
 
-        if signals_to_return:
-            print(f"✅ Returned 1 signal to {slave_id}")
+    if cleared:
+        return {"status": "cleared", **cleared}, 200
+    else:
+        return {"status": "nothing_to_clear"}, 200
 
-        return jsonify(
-            {
-                "status": "ok",
-                "signals": signals_to_return,
-                "count": len(signals_to_return),
-                "timestamp": datetime.now().isoformat(),
+
+def handle_status(verbose=False):
+    """Get detailed server status (verbose adds each master's signal list)"""
+    now_ms, now_iso = _now()
+    master_stats = {}
+
+    for master_id in list(signals_queue):
+        with master_locks[master_id]:
+            _expire_signals(master_id, now_ms)
+            if master_id not in signals_queue:
+                continue
+
+            queue = signals_queue[master_id]
+            master_stats[master_id] = {
+                "pending_signals": _pending_count(master_id),
+                "latest_signal": next(
+                    (_wire_signal(s) for s in reversed(queue) if s is not None),
+                    None,
+                ),
+                "oldest_signal": next(
+                    (_wire_signal(s) for s in queue if s is not None), None
+                ),
+                "connected_slaves": list(slaves.get(master_id, {}).keys()),
+                "signals_by_action": dict(signals_by_action[master_id]),
             }
-        )
+
+            # Show all signal tickets for debugging
+            if verbose:
+                master_stats[master_id]["signal_list"] = [
+                    f"{s['master_ticket']}({s['action']})"
+                    for s in queue
+                    if s is not None
+                ]
+
+    # Slave stats
+    slave_stats = {}
+    for slave_id, processed in list(slave_processed_signals.items()):
+        slave_stats[slave_id] = {
+            "processed_count": len(processed),
+            "last_10_processed": [str(sid) for sid in processed.recent(10)],
+        }
+
+    return {
+        "status": "running",
+        "version": "6.0",
+        "timestamp": now_iso,
+        "masters": master_stats,
+        "slaves": slave_stats,
+        "total_pending_signals": sum(
+            stats["pending_signals"] for stats in master_stats.values()
+        ),
+    }, 200
+
+
+# ==================== ROUTES ====================
+@app.route("/", methods=["GET"])
+def home():
+    return handle_home()
+
+
+@app.route("/upload_signal", methods=["POST"])
+def upload_signal():
+    """Master EA sends trade signal"""
+    try:
+        return handle_upload_signal(request.get_json(cache=False))
+
+    except Exception as e:
+        log.exception("ERROR in upload_signal: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/register_slave", methods=["POST"])
+def register_slave():
+    """Slave EA registers to copy from master"""
+    try:
+        return handle_register_slave(request.get_json(cache=False))
 
     except Exception as e:
-        print(f"❌ ERROR in slave_poll: {e}")
-        import traceback
+        log.error("ERROR in register_slave: %s", e)
+        return jsonify({"error": str(e)}), 500
+
 
-        traceback.print_exc()
+@app.route("/slave_poll", methods=["GET"])
+def slave_poll():
+    """Slave EA polls for new signals - FIXED VERSION"""
+    try:
+        body, code = handle_slave_poll(
+            request.args.get("slave_id"), request.args.get("master_id")
+        )
+
+        if isinstance(body, dict):
+            return body, code
+
+        # Hot path: already serialized, bypass the JSON provider
+        return Response(body, status=code, mimetype="application/json")
+
+    except Exception as e:
+        log.exception("ERROR in slave_poll: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -333,32 +668,7 @@ def slave_poll():
 def clear_signals():
     """Clear signals and processed tracking"""
     try:
-        data = request.get_json()
-        master_id = data.get("master_id")
-        slave_id = data.get("slave_id")
-
-        cleared = {}
-
-        if slave_id:
-            # Clear processed signals for slave
-            if slave_id in slave_processed_signals:
-                count = len(slave_processed_signals[slave_id])
-                slave_processed_signals[slave_id].clear()
-                print(f"🗑️ Cleared {count} processed signals for slave {slave_id}")
-                cleared["slave_processed"] = count
-
-        if master_id:
-            # Clear signal queue for master
-            if master_id in signals_queue:
-                count = len(signals_queue[master_id])
-                del signals_queue[master_id]
-                print(f"🗑️ Cleared {count} signals for master {master_id}")
-                cleared["master_queue"] = count
-
-        if cleared:
-            return jsonify({"status": "cleared", **cleared})
-        else:
-            return jsonify({"status": "nothing_to_clear"})
+        return handle_clear_signals(request.get_json(cache=False))
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -366,50 +676,8 @@ def clear_signals():
 
 @app.route("/status", methods=["GET"])
 def status():
-    """Get detailed server status"""
-    master_stats = {}
-
-    for master_id, signals in signals_queue.items():
-        master_stats[master_id] = {
-            "pending_signals": len(signals),
-            "latest_signal": signals[-1] if signals else None,
-            "oldest_signal": signals[0] if signals else None,
-            "connected_slaves": list(slaves.get(master_id, {}).keys()),
-            "signals_by_action": {},
-        }
-
-        # Count by action type
-        for sig in signals:
-            action = sig.get("action")
-            if action:
-                master_stats[master_id]["signals_by_action"][action] = (
-                    master_stats[master_id]["signals_by_action"].get(action, 0) + 1
-                )
-
-        # Show all signal tickets for debugging
-        signal_tickets = [
-            f"{s.get('master_ticket')}({s.get('action')})" for s in signals
-        ]
-        master_stats[master_id]["signal_list"] = signal_tickets
-
-    # Slave stats
-    slave_stats = {}
-    for slave_id, processed in slave_processed_signals.items():
-        slave_stats[slave_id] = {
-            "processed_count": len(processed),
-            "last_10_processed": list(processed)[-10:] if processed else [],
-        }
-
-    return jsonify(
-        {
-            "status": "running",
-            "version": "6.0",
-            "timestamp": datetime.now().isoformat(),
-            "masters": master_stats,
-            "slaves": slave_stats,
-            "total_pending_signals": sum(len(sigs) for sigs in signals_queue.values()),
-        }
-    )
+    """Get detailed server status (?verbose=1 adds each master's signal list)"""
+    return handle_status(request.args.get("verbose") == "1")
 
 
 # ==================== MAIN ====================